@@ -1,16 +1,32 @@
+import io
+import queue
 import socket
+import struct
 import subprocess
 import threading
 import random
+import functools
+import time
+import selectors
 from typing import Callable, Any
 import adbutils
 import av
+from av.codec.hwaccel import HWAccel
+from av.video.plane import VideoPlane
 import numpy as np
 import pathlib
 import logging
 from adbutils import AdbDevice
 from enum import Enum
 
+try:
+    import numba
+
+    _prange = numba.prange
+except ImportError:  # numba is optional, only needed for `use_numba`
+    numba = None
+    _prange = range
+
 # TODO extract server version from server binary?
 SERVER_VERSION = "3.3.3"
 SERVER_REMOTE_PATH = "/data/local/tmp/scrcpy-server.jar"
@@ -20,14 +36,255 @@ DEFAULT_MAX_FPS = 30
 
 DEVICE_NAME_FIELD_LENGTH = 64
 CODEC_ID_FIELD_LENGTH = 4
-VIDEO_HEADER_FIELD_LENGTH = (4, 4)  # w, h
+# device name, codec id, w, h
+_STREAM_HEADER = struct.Struct(
+    f">{DEVICE_NAME_FIELD_LENGTH}s{CODEC_ID_FIELD_LENGTH}sII"
+)
+
+# Looking up the adb binary can shell out, and it doesn't change while running
+_adb_path = functools.cache(adbutils.adb_path)
+
+SUPPORTED_FRAME_FORMATS = ("bgr24", "rgb24", "yuv420p")
+
+_PACKET_HEADER = struct.Struct(">QI")  # pts, packet size
+STREAM_BUFFER_SIZE = 1 << 20
+DEFAULT_RECV_CHUNK = 1 << 16
+RECV_CHUNK_RANGE = (1 << 14, 1 << 18)
+DEFAULT_RCVBUF_BYTES = 4 * 1024 * 1024
+
+# How the stream buffer is shrunk once it is drained
+BUFFER_RELAX_NEVER = 0  # keep any growth for the whole session
+BUFFER_RELAX_SHRINK = 1  # shrink back to STREAM_BUFFER_SIZE after oversized packets
+BUFFER_RELAX_FREE = 2  # free the buffer whenever the stream is idle
 
 
 class ListenEvent(Enum):
     FRAME = "frame"
+    FRAME_YUV_PLANES = "frame_yuv_planes"
     INIT = "init"
 
 
+def _frame_shape(frame_format: str, width: int, height: int) -> tuple[int, ...]:
+    """Returns the ndarray shape of a frame in the given format."""
+    if frame_format == "yuv420p":
+        return (height * 3 // 2, width)
+    return (height, width, 3)
+
+
+def _plane_to_ndarray(plane: VideoPlane, row_bytes: int) -> np.ndarray:
+    """Returns a (height, row_bytes) view of a frame plane, without the row padding."""
+    rows = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+    return rows[:, :row_bytes]
+
+
+def _frame_to_ndarray(
+    frame: av.VideoFrame,
+    frame_format: str,
+    out: np.ndarray | None = None,
+    use_numba: bool = False,
+) -> np.ndarray:
+    """
+    Same as `frame.to_ndarray(format=frame_format)`, but copies the result into `out`.
+
+    Only worth it where a copy is made anyway: yuv420p planes are concatenated by
+    `to_ndarray` too, the numba kernel needs an output array, and the frame queue keeps
+    frames past the decoder's buffer. For packed formats, `to_ndarray` alone returns a
+    view without copying, which is cheaper. A new array is only allocated if `out` is
+    missing or has the wrong shape (e.g. the device was rotated). With `use_numba`,
+    yuv420p frames are converted to bgr24 by the numba kernel instead of libswscale.
+    """
+    shape = _frame_shape(frame_format, frame.width, frame.height)
+    if out is None or out.shape != shape:
+        out = np.empty(shape, dtype=np.uint8)
+
+    if use_numba and frame_format == "bgr24" and frame.format.name == "yuv420p":
+        y, u, v = frame.planes
+        _yuv420p_to_bgr24(
+            _plane_to_ndarray(y, y.width),
+            _plane_to_ndarray(u, u.width),
+            _plane_to_ndarray(v, v.width),
+            out,
+        )
+        return out
+
+    if frame.format.name != frame_format:
+        frame = frame.reformat(format=frame_format)
+
+    # Planes are copied back to back, dropping the row padding (line_size)
+    flat = out.reshape(-1)
+    offset = 0
+    for plane in frame.planes:
+        row_bytes = plane.width * (1 if frame_format == "yuv420p" else 3)
+        size = row_bytes * plane.height
+        np.copyto(
+            flat[offset : offset + size].reshape(plane.height, row_bytes),
+            _plane_to_ndarray(plane, row_bytes),
+        )
+        offset += size
+
+    return out
+
+
+def _yuv420p_to_bgr24(y: np.ndarray, u: np.ndarray, v: np.ndarray, out: np.ndarray):
+    """Converts yuv420p planes (BT.601, limited range like libswscale) to bgr24 in `out`."""
+    height, width = y.shape
+    for row in _prange(height):
+        for col in range(width):
+            # 8 bit fixed point coefficients
+            c = 298 * (np.int32(y[row, col]) - 16) + 128
+            d = np.int32(u[row >> 1, col >> 1]) - 128
+            e = np.int32(v[row >> 1, col >> 1]) - 128
+            out[row, col, 0] = min(max((c + 516 * d) >> 8, 0), 255)
+            out[row, col, 1] = min(max((c - 100 * d - 208 * e) >> 8, 0), 255)
+            out[row, col, 2] = min(max((c + 409 * e) >> 8, 0), 255)
+
+
+if numba is not None:
+    _yuv420p_to_bgr24 = numba.njit(parallel=True, cache=True, fastmath=True)(
+        _yuv420p_to_bgr24
+    )
+
+
+def _is_disposable(data: bytes) -> bool:
+    """
+    Returns whether no other frame references this H.264 access unit.
+
+    That is the case if its slices have nal_ref_idc == 0. The parser doesn't set
+    AV_PKT_FLAG_DISPOSABLE, so the NAL unit headers are checked directly.
+    """
+    pos = data.find(b"\x00\x00\x01")
+    while pos != -1 and pos + 3 < len(data):
+        header = data[pos + 3]
+        if header & 0x1F in (1, 5):  # (IDR) slice
+            # All slices of a picture share nal_ref_idc, so the first one decides
+            return (header >> 5) & 3 == 0
+        pos = data.find(b"\x00\x00\x01", pos + 3)
+    return False
+
+
+class _StreamBuffer:
+    """
+    Accumulates the raw video stream and splits it into scrcpy packets.
+
+    Data is appended at `write_off` and consumed from `read_off`, so taking a packet
+    out of the buffer does not shift the remaining bytes. The unread tail is only
+    moved to the front once more than half of the buffer has been consumed.
+    """
+
+    def __init__(
+        self, size: int = STREAM_BUFFER_SIZE, relax_mode: int = BUFFER_RELAX_SHRINK
+    ):
+        self._size: int = size
+        self._relax_mode: int = relax_mode
+        self._buffer: bytearray = bytearray(size)
+        self._view: memoryview = memoryview(self._buffer)
+        self.read_off: int = 0
+        self.write_off: int = 0
+
+    def __len__(self) -> int:
+        return self.write_off - self.read_off
+
+    def write(self, data: bytes):
+        """Appends data to the buffer, compacting or growing it if needed."""
+        n = len(data)
+        self._reserve(n)
+        self._view[self.write_off : self.write_off + n] = data
+        self.write_off += n
+
+    def recv_into(self, sock: socket.socket, n: int) -> int:
+        """
+        Receives up to n bytes from the socket directly into the buffer.
+
+        Returns the number of bytes received, 0 if the connection was closed.
+        """
+        self._reserve(n)
+        received = sock.recv_into(self._view[self.write_off : self.write_off + n], n)
+        self.write_off += received
+        return received
+
+    def _reserve(self, n: int):
+        """Makes room for n more bytes, compacting or growing the buffer if needed."""
+        if self.read_off > len(self._buffer) // 2:
+            self._compact()
+        if self.write_off + n > len(self._buffer):
+            self._make_room(n)
+
+    def next_packet(self) -> memoryview | None:
+        """
+        Returns the payload of the next complete packet, or None if it is not fully received yet.
+
+        The returned view is only valid until the next `write`.
+        """
+        if len(self) < _PACKET_HEADER.size:
+            return None
+
+        _, packet_size = _PACKET_HEADER.unpack_from(self._buffer, self.read_off)
+        start = self.read_off + _PACKET_HEADER.size
+        end = start + packet_size
+        if end > self.write_off:
+            return None
+
+        self.read_off = end
+        if self.read_off == self.write_off:
+            self.read_off = self.write_off = 0
+
+        return self._view[start:end]
+
+    def next_packets(self) -> list[memoryview]:
+        """
+        Returns the payloads of all complete packets in the buffer.
+
+        The returned views are only valid until the next `write`.
+        """
+        packets: list[memoryview] = []
+        while (packet := self.next_packet()) is not None:
+            packets.append(packet)
+        return packets
+
+    def _compact(self):
+        """Moves the unread data to the front of the buffer."""
+        pending = len(self)
+        self._view[:pending] = self._view[self.read_off : self.write_off]
+        self.read_off = 0
+        self.write_off = pending
+
+    def relax(self, idle: bool = False):
+        """
+        Gives memory back once the buffer is drained, depending on the relax mode.
+
+        The buffer is only freed entirely when the stream is idle, otherwise it would
+        be reallocated on almost every read.
+        """
+        if len(self) > 0:
+            return
+
+        if self._relax_mode == BUFFER_RELAX_SHRINK and len(self._buffer) > self._size:
+            self._replace(bytearray(self._size))
+        elif self._relax_mode == BUFFER_RELAX_FREE and idle and len(self._buffer) > 0:
+            self._replace(bytearray())
+
+    def _make_room(self, n: int):
+        """Ensures at least n bytes can be written, growing the buffer for oversized packets."""
+        self._compact()
+        if self.write_off + n <= len(self._buffer):
+            return
+
+        # A freed buffer only regrows to what is actually needed
+        size = len(self._buffer) or n
+        while self.write_off + n > size:
+            size *= 2
+
+        buffer = bytearray(size)
+        buffer[: self.write_off] = self._view[: self.write_off]
+        self._replace(buffer)
+
+    def _replace(self, buffer: bytearray):
+        """Swaps in a new underlying buffer, which must already contain the unread data."""
+        self._view.release()
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+
+
 class ScrcpyClient:
     """
     A Python client for Scrcpy server.
@@ -35,7 +292,14 @@ class ScrcpyClient:
     This client handles the connection and video stream decoding.
     It uses the default reverse tunnel method to connect to the device.
 
-    Frames are encoded as bgr24
+    Frames are encoded as bgr24 by default. Use `frame_format="yuv420p"` to get the
+    decoder output without colorspace conversion, as a (h * 3 / 2, w) array (I420).
+
+    bgr24/rgb24 frames are fresh arrays. yuv420p frames, frames converted with numba and
+    all frames passed through a frame queue reuse their arrays instead: both the arrays
+    passed to listeners and `last_frame` are overwritten by later frames (two frames
+    later, or as soon as the listeners return with a frame queue). Call `.copy()` to keep
+    such a frame, e.g. `frame = client.last_frame.copy()` when polling from another thread.
     """
 
     __logger = logging.getLogger(__name__)
@@ -45,6 +309,18 @@ class ScrcpyClient:
         device: AdbDevice,
         server_path: str,
         server_args: dict[str, str] | None = None,
+        hwaccel: str | None = None,
+        frame_format: str = "bgr24",
+        frame_queue_size: int = 0,
+        pause_empty_proportion: float = 0.1,
+        unpause_empty_proportion: float = 0.5,
+        use_numba: bool = False,
+        recv_chunk: int = DEFAULT_RECV_CHUNK,
+        rcvbuf_bytes: int = DEFAULT_RCVBUF_BYTES,
+        max_consumer_lag: int | None = None,
+        buffer_relax: int = BUFFER_RELAX_SHRINK,
+        target_fps: float | None = None,
+        thread_count: int | None = None,
     ):
         """
         Initialize the client.
@@ -53,8 +329,60 @@ class ScrcpyClient:
             device_serial: The serial of the device.
             server_path: The local path to the scrcpy server file.
             server_args: The server args you want to overwrite.
+            hwaccel: The hardware device type used for decoding (e.g. "cuda", "videotoolbox", "vaapi").
+                     Falls back to software decoding if the device is unavailable.
+            frame_format: The format of the delivered frames ("bgr24", "rgb24" or "yuv420p").
+            frame_queue_size: If > 0, decoded frames are copied into a pool of this many preallocated
+                              buffers and the listeners are called from a separate dispatch thread.
+                              If 0, listeners are called directly from the stream loop.
+            pause_empty_proportion: Stop queueing new frames once less than this proportion of the
+                                    frame pool is free (the consumer is lagging behind).
+            unpause_empty_proportion: Queue frames again once at least this proportion of the frame
+                                      pool is free.
+            use_numba: Convert frames to bgr24 with a parallel numba kernel instead of libswscale.
+                       Requires the optional numba dependency.
+            recv_chunk: The maximum number of bytes read from the video socket at once.
+                        Must be a power of two between 16 KiB and 256 KiB.
+            rcvbuf_bytes: The kernel receive buffer size (SO_RCVBUF) of the video socket, large
+                          enough to hold keyframe bursts without stalling the stream.
+            max_consumer_lag: If set, packets are not decoded while the consumer lags behind by more
+                              than this many frames, until the next keyframe. The lag is the number
+                              of queued frames with a frame queue, otherwise `consumer_lag`.
+            buffer_relax: How the stream buffer gives memory back once drained. 0 never shrinks,
+                          1 shrinks it back to its initial size after oversized (keyframe) packets,
+                          2 frees it whenever the stream is idle.
+            target_fps: If set, disposable (non-reference) packets arriving faster than this rate
+                        are not decoded. H.264 P-frames are usually references, so this only helps
+                        streams which contain disposable frames.
+            thread_count: If set, enables frame (and slice) threading with this many decoder threads.
+                          Frame threading delays each frame by up to thread_count - 1 frames.
+                          By default only slice threading is used, which adds no latency.
         """
 
+        if frame_format not in SUPPORTED_FRAME_FORMATS:
+            raise ValueError(f"Unsupported frame format: {frame_format}")
+        if (
+            not RECV_CHUNK_RANGE[0] <= recv_chunk <= RECV_CHUNK_RANGE[1]
+            or recv_chunk & (recv_chunk - 1) != 0
+        ):
+            raise ValueError(
+                f"recv_chunk must be a power of two between {RECV_CHUNK_RANGE[0]} and {RECV_CHUNK_RANGE[1]}, got {recv_chunk}"
+            )
+        if buffer_relax not in (
+            BUFFER_RELAX_NEVER,
+            BUFFER_RELAX_SHRINK,
+            BUFFER_RELAX_FREE,
+        ):
+            raise ValueError(f"Unknown buffer relax mode: {buffer_relax}")
+        if frame_queue_size < 0:
+            raise ValueError(
+                f"frame_queue_size must not be negative, got {frame_queue_size}"
+            )
+        if not 0 <= pause_empty_proportion < unpause_empty_proportion <= 1:
+            raise ValueError(
+                f"Expected 0 <= pause_empty_proportion < unpause_empty_proportion <= 1, got {pause_empty_proportion} and {unpause_empty_proportion}"
+            )
+
         real_path = pathlib.Path(server_path)
         if not real_path.exists():
             raise FileNotFoundError(f"scrcpy server not found at `{real_path}`")
@@ -67,16 +395,27 @@ class ScrcpyClient:
 
         self.listeners: dict[ListenEvent, list[Callable[..., Any]]] = {
             ListenEvent.FRAME: [],
+            ListenEvent.FRAME_YUV_PLANES: [],
             ListenEvent.INIT: [],
         }  # pyright: ignore[reportExplicitAny]
+        # Snapshots of the frame listeners, rebuilt on every change, for the per-frame hot path
+        self._frame_listeners: tuple[Callable[..., Any], ...] = ()  # pyright: ignore[reportExplicitAny]
+        self._yuv_planes_listeners: tuple[Callable[..., Any], ...] = ()  # pyright: ignore[reportExplicitAny]
         self.is_running: bool = False
+        # May be a reused buffer (see the class docstring), `.copy()` it before using it from another thread
         self.last_frame: np.ndarray | None = None
         self.resolution: tuple[int, int] | None = None
 
         self._server_process: subprocess.Popen[bytes] | None = None
         self._video_socket: socket.socket | None = None
+        self._video_stream: io.BufferedReader | None = None
         self._control_socket: socket.socket | None = None
+        # `stop` writes to this socket pair to wake up the stream loop
+        self._wakeup_r: socket.socket | None = None
+        self._wakeup_w: socket.socket | None = None
         self._stream_thread: threading.Thread | None = None
+        # The thread running the stream loop, in both threaded and unthreaded mode
+        self._loop_thread: threading.Thread | None = None
         self._local_port: int | None = None
         self.device_name: str = "unknown"
         self.video_codec: str = "h264"
@@ -84,6 +423,35 @@ class ScrcpyClient:
         self._custom_server_args: dict[str, str] = (
             {} if server_args is None else server_args
         )
+        # Only depends on values fixed at construction, so build it once
+        self._server_args: list[str] = self._get_server_args()
+        self.hwaccel: str | None = hwaccel
+        self.frame_format: str = frame_format
+
+        self.frame_queue_size: int = frame_queue_size
+        self.pause_empty_proportion: float = pause_empty_proportion
+        self.unpause_empty_proportion: float = unpause_empty_proportion
+        self._empty_frames: queue.Queue[np.ndarray] | None = None
+        self._full_frames: queue.Queue[np.ndarray | None] | None = None
+        self._dispatch_thread: threading.Thread | None = None
+        self._queue_paused: bool = False
+
+        if use_numba and numba is None:
+            self.__logger.warning(
+                "numba is not installed, falling back to libswscale for frame conversion."
+            )
+        self.use_numba: bool = use_numba and numba is not None
+
+        self.recv_chunk: int = recv_chunk
+        self.rcvbuf_bytes: int = rcvbuf_bytes
+
+        self.max_consumer_lag: int | None = max_consumer_lag
+        # Number of frames the consumer is behind, listeners can update this
+        self.consumer_lag: int = 0
+
+        self.buffer_relax: int = buffer_relax
+        self.target_fps: float | None = target_fps
+        self.thread_count: int | None = thread_count
 
     def _get_server_args(self) -> list[str]:
         """Constructs the arguments to start the scrcpy server on the device."""
@@ -96,18 +464,17 @@ class ScrcpyClient:
 
         all = predefined | self._custom_server_args
 
-        server_args = [SERVER_VERSION, f"scid={self.scid:x}"]
-
-        for key, value in all.items():
-            server_args.append(f"{key}={value}")
-        
-        return server_args
+        return [
+            SERVER_VERSION,
+            f"scid={self.scid:x}",
+            *(f"{key}={value}" for key, value in all.items()),
+        ]
 
     def _push_server(self):
         """Pushes the scrcpy-server to the device if it's missing or outdated."""
 
         self.__logger.debug(
-            f"[{self.device.serial}] Checking server on {SERVER_REMOTE_PATH}..."
+            "[%s] Checking server on %s...", self.device.serial, SERVER_REMOTE_PATH
         )
         try:
             remote_stat = self.device.sync.stat(SERVER_REMOTE_PATH)
@@ -117,27 +484,31 @@ class ScrcpyClient:
                 local_stat.st_mtime
             ):
                 self.__logger.debug(
-                    f"[{self.device.serial}] Server is already up-to-date."
+                    "[%s] Server is already up-to-date.", self.device.serial
                 )
                 return  # Server is present and matches, don't push
 
         except FileNotFoundError:
-            self.__logger.debug(f"[{self.device.serial}] Server not found on device.")
+            self.__logger.debug("[%s] Server not found on device.", self.device.serial)
             # File doesn't exist, proceed to push
         except Exception as e:
             self.__logger.warning(
-                f"[{self.device.serial}] Failed to stat remote server: {e}. Will try to push anyway."
+                "[%s] Failed to stat remote server: %s. Will try to push anyway.",
+                self.device.serial,
+                e,
             )
             # Other issue (maybe permission), lets still try to push
 
         self.__logger.debug(
-            f"[{self.device.serial}] Pushing server to {SERVER_REMOTE_PATH}..."
+            "[%s] Pushing server to %s...", self.device.serial, SERVER_REMOTE_PATH
         )
         try:
             _ = self.device.sync.push(self.server_path, SERVER_REMOTE_PATH)
-            self.__logger.debug(f"[{self.device.serial}] Server pushed successfully.")
+            self.__logger.debug("[%s] Server pushed successfully.", self.device.serial)
         except Exception as e:
-            self.__logger.error(f"[{self.device.serial}] Failed to push server: {e}.")
+            self.__logger.error(
+                "[%s] Failed to push server: %s.", self.device.serial, e
+            )
 
             # very bad, lets fail
             raise IOError(f"Failed to push scrcpy-server to device: {e}")
@@ -146,21 +517,20 @@ class ScrcpyClient:
         """Starts the scrcpy server on the device."""
         assert self.device.serial is not None, "Device serial is None"
 
-        self.__logger.debug(f"[{self.device.serial}] Starting server...")
+        self.__logger.debug("[%s] Starting server...", self.device.serial)
         # Command to execute on the device
-        server_args = self._get_server_args()
         command = [
             "CLASSPATH=" + SERVER_REMOTE_PATH,
             "app_process",
             "/",
             "com.genymobile.scrcpy.Server",
-            *server_args,
+            *self._server_args,
         ]
 
         # Use adb shell to run the command in the background
         # Note: We can't use device.shell with Popen semantics from adbutils, so we use adb binary directly.
         adb_command: list[str] = [
-            adbutils.adb_path(),
+            _adb_path(),
             "-s",
             self.device.serial,
             "shell",
@@ -172,25 +542,28 @@ class ScrcpyClient:
         )
 
         self.__logger.info(
-            f"[{self.device.serial}] Server process started with PID: {self._server_process.pid}"
+            "[%s] Server process started with PID: %s",
+            self.device.serial,
+            self._server_process.pid,
         )
 
-    def _recv_all(self, sock: socket.socket, n: int) -> bytes:
-        """Helper to receive exactly n bytes from a socket."""
+    def _recv_all(self, n: int) -> bytes:
+        """Helper to receive exactly n bytes from the video stream."""
+        assert self._video_stream is not None, "Video stream is None"
 
-        data = bytearray()
-        while len(data) < n:
-            packet = sock.recv(n - len(data))
-            if not packet:
-                raise ConnectionAbortedError("Socket connection broken")
-            data.extend(packet)
-        return bytes(data)
+        data = self._video_stream.read(n)
+        if len(data) < n:
+            raise ConnectionAbortedError("Socket connection broken")
+        return data
 
     def _connect_sockets(self) -> bool:
         """Sets up the reverse tunnel and connects the video and control sockets."""
-        self.__logger.debug(f"[{self.device.serial}] Setting up reverse tunnel...")
+        self.__logger.debug("[%s] Setting up reverse tunnel...", self.device.serial)
 
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Set before listening, so the accepted sockets inherit it and the TCP window
+        # is negotiated with the larger buffer
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_bytes)
         server_socket.bind(("127.0.0.1", 0))
         self._local_port = server_socket.getsockname()[1]
         server_socket.listen(2)
@@ -203,59 +576,63 @@ class ScrcpyClient:
 
         try:
             self.__logger.debug(
-                f"[{self.device.serial}] Waiting for video socket connection..."
+                "[%s] Waiting for video socket connection...", self.device.serial
             )
             server_socket.settimeout(30)
             self._video_socket, _ = server_socket.accept()  # pyright: ignore[reportAny]
-            self.__logger.debug(f"[{self.device.serial}] Video socket connected.")
+            self._video_socket.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_bytes
+            )
+            # Buffered reads for the handshake, the stream loop reads the socket directly
+            self._video_stream = self._video_socket.makefile(
+                "rb", buffering=io.DEFAULT_BUFFER_SIZE
+            )
+            self.__logger.debug("[%s] Video socket connected.", self.device.serial)
 
             self.__logger.debug(
-                f"[{self.device.serial}] Waiting for control socket connection..."
+                "[%s] Waiting for control socket connection...", self.device.serial
             )
             self._control_socket, _ = server_socket.accept()  # pyright: ignore[reportAny]
-            self.__logger.debug(f"[{self.device.serial}] Control socket connected.")
+            # Control messages are small, don't let Nagle delay them
+            self._control_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__logger.debug("[%s] Control socket connected.", self.device.serial)
             server_socket.settimeout(None)
 
-            # read device metadata (64 bytes)
-            device_name_bytes = self._recv_all(
-                self._video_socket, DEVICE_NAME_FIELD_LENGTH
+            # read device metadata (64 bytes), codec ID (4 bytes) and
+            # video header (4 bytes width + 4 bytes height) at once
+            device_name_bytes, codec_id_bytes, width, height = _STREAM_HEADER.unpack(
+                self._recv_all(_STREAM_HEADER.size)
             )
-            self.device_name = device_name_bytes.decode("utf-8").rstrip("\x00")
+            self.device_name = device_name_bytes.rstrip(b"\x00").decode("utf-8")
             self.__logger.debug(
-                f"[{self.device.serial}] Device name: {self.device_name}"
+                "[%s] Device name: %s", self.device.serial, self.device_name
             )
 
-            # read codec ID (4 bytes)
-            codec_id_bytes = self._recv_all(self._video_socket, CODEC_ID_FIELD_LENGTH)
             self.video_codec = codec_id_bytes.decode("utf-8")
             self.__logger.debug(
-                f"[{self.device.serial}] Video Codec: {self.video_codec}"
+                "[%s] Video Codec: %s", self.device.serial, self.video_codec
             )
 
             # TODO support more codecs (i think scrcpy supports more)
             if self.video_codec.lower() != "h264":
                 self.__logger.error(
-                    f"[{self.device.serial}] Unsupported codec: {self.video_codec}. Only h264 is supported."
+                    "[%s] Unsupported codec: %s. Only h264 is supported.",
+                    self.device.serial,
+                    self.video_codec,
                 )
                 return False
 
-            # read video header (4 bytes width + 4 bytes height)
-            width_bytes = self._recv_all(
-                self._video_socket, VIDEO_HEADER_FIELD_LENGTH[0]
-            )
-            height_bytes = self._recv_all(
-                self._video_socket, VIDEO_HEADER_FIELD_LENGTH[1]
-            )
-            width = int.from_bytes(width_bytes, byteorder="big")
-            height = int.from_bytes(height_bytes, byteorder="big")
             self.resolution = (width, height)
 
-            self.__logger.debug(f"[{self.device.serial}] Resolution: {width}x{height}")
+            self.__logger.debug(
+                "[%s] Resolution: %sx%s", self.device.serial, width, height
+            )
 
             # Check for bad resolution
             if self.resolution == (0, 0):
                 self.__logger.error(
-                    f"[{self.device.serial}] Got 0x0 resolution. Is the device screen on?"
+                    "[%s] Got 0x0 resolution. Is the device screen on?",
+                    self.device.serial,
                 )
                 return False
 
@@ -264,7 +641,8 @@ class ScrcpyClient:
             return True
         except socket.timeout:
             self.__logger.error(
-                f"[{self.device.serial}] Socket connection timed out. Is the server running?"
+                "[%s] Socket connection timed out. Is the server running?",
+                self.device.serial,
             )
             return False
         except (
@@ -274,89 +652,314 @@ class ScrcpyClient:
             ConnectionResetError,
         ) as e:
             self.__logger.error(
-                f"[{self.device.serial}] Failed to connect sockets: {e}"
+                "[%s] Failed to connect sockets: %s", self.device.serial, e
             )
             return False
         finally:
             server_socket.close()
 
-    def _stream_loop(self):
-        """The main loop to receive and decode video frames."""
-        assert self._video_socket is not None, "Video socket is None"
-
-        self.__logger.debug(f"[{self.device.serial}] Starting video stream loop...")
+    def _create_codec(self) -> av.CodecContext:
+        """Creates the video decoder, using hardware acceleration if requested and available."""
+        codec_name = self.video_codec.lower()
+        codec: av.CodecContext | None = None
 
-        codec = av.CodecContext.create(self.video_codec.lower(), "r")
-        data_buffer: bytearray = bytearray()
-
-        while self.is_running:
+        if self.hwaccel is not None:
             try:
-                self._video_socket.settimeout(0.1)
-                try:
-                    chunk = self._video_socket.recv(0x10000)
-                    if not chunk:
-                        self.__logger.debug(
-                            f"[{self.device.serial}] Video stream ended (socket closed)."
-                        )
-                        break
-                    data_buffer.extend(chunk)
-                except socket.timeout:
-                    continue  # Nothing received, just loop again
-
-                while self.is_running:
-                    if len(data_buffer) < 12:
-                        break  # Not enough data for a header
+                accel = HWAccel(device_type=self.hwaccel, allow_software_fallback=True)
+                codec = av.CodecContext.create(codec_name, "r", hwaccel=accel)
+            except Exception as e:
+                self.__logger.warning(
+                    "[%s] Failed to initialize hwaccel '%s': %s. Falling back to software decoding.",
+                    self.device.serial,
+                    self.hwaccel,
+                    e,
+                )
 
-                    packet_size = int.from_bytes(data_buffer[8:12], byteorder="big")
+        if codec is None:
+            codec = av.CodecContext.create(codec_name, "r")
 
-                    if len(data_buffer) < 12 + packet_size:
-                        break  # Not enough data for the full packet
+        # Has to be set before the first packet is decoded, which opens the codec.
+        # Frame threading holds frames back, so it is only used when asked for.
+        if self.thread_count is not None:
+            codec.thread_type = "AUTO"
+            codec.thread_count = self.thread_count
+        else:
+            codec.thread_type = "SLICE"
+        return codec
 
-                    packet_data = data_buffer[12 : 12 + packet_size]
-                    del data_buffer[: 12 + packet_size]
+    def _stream_loop(self):
+        """The main loop to receive and decode video frames."""
+        assert self._video_stream is not None, "Video stream is None"
+
+        self.__logger.debug("[%s] Starting video stream loop...", self.device.serial)
+        self._loop_thread = threading.current_thread()
+
+        codec = self._create_codec()
+        data_buffer = _StreamBuffer(relax_mode=self.buffer_relax)
+
+        # `to_ndarray` copies yuv420p frames anyway and the numba kernel needs an output,
+        # so those frames are written into two alternating buffers instead, keeping
+        # `last_frame` intact while the next frame is written. Packed frames are
+        # zero-copy views of a fresh frame, reusing buffers would only add a copy.
+        use_buffers = self.frame_format == "yuv420p" or self.use_numba
+        assert self.resolution is not None, "Resolution is None"
+        shape = _frame_shape(self.frame_format, *self.resolution)
+        frame_buffers = [
+            np.empty(shape, dtype=np.uint8) for _ in range(2 if use_buffers else 0)
+        ]
+        buffer_index = 0
+
+        assert self._video_socket is not None and self._wakeup_r is not None
+        self._video_socket.setblocking(False)
+        # The socket file may have read past the handshake, hand that data over.
+        # It isn't needed afterwards, closing it leaves the socket open.
+        data_buffer.write(self._video_stream.read1(io.DEFAULT_BUFFER_SIZE))
+        self._video_stream.close()
+
+        wakeup_r, wakeup_w = self._wakeup_r, self._wakeup_w
+        selector = selectors.DefaultSelector()
+        _ = selector.register(self._video_socket, selectors.EVENT_READ)
+        _ = selector.register(wakeup_r, selectors.EVENT_READ)
+
+        # Bind everything used per packet/frame to locals, saving the attribute lookups
+        parse = codec.parse
+        decode = codec.decode
+        next_packets = data_buffer.next_packets
+        relax_buffer = data_buffer.relax
+        recv_into = data_buffer.recv_into
+        video_socket = self._video_socket
+        recv_chunk = self.recv_chunk
+        select = selector.select
+        send_frame = self._send_frame
+        send_yuv_planes = self._send_yuv_planes
+        queue_frame = self._queue_frame if self._full_frames is not None else None
+        frame_format = self.frame_format
+        use_numba = self.use_numba
+        max_consumer_lag = self.max_consumer_lag
+        full_frames = self._full_frames
+        # Once a frame is skipped, every frame up to the next keyframe has to be skipped,
+        # as they (indirectly) reference the skipped one
+        skipping = False
+        min_frame_interval = 1 / self.target_fps if self.target_fps else None
+        last_decoded = 0.0
+        monotonic = time.monotonic
+
+        stream_ended = False
+        while self.is_running and not stream_ended:
+            try:
+                # Hand all complete packets to the parser in one go, so the parser gets
+                # contiguous input and is called once per read instead of once per packet
+                payloads = next_packets()
+                if payloads:
+                    packet_data = (
+                        payloads[0] if len(payloads) == 1 else b"".join(payloads)
+                    )
 
-                    packets = codec.parse(packet_data)
+                    for packet in parse(packet_data):
+                        # A listener may have called `stop`, drop the rest of the batch
+                        if not self.is_running:
+                            break
+
+                        if max_consumer_lag is not None:
+                            if packet.is_keyframe:
+                                skipping = False
+                            elif not skipping:
+                                lag = (
+                                    full_frames.qsize()
+                                    if full_frames is not None
+                                    else self.consumer_lag
+                                )
+                                if lag > max_consumer_lag:
+                                    skipping = True
+                                    self.__logger.debug(
+                                        "[%s] Consumer lags %s frames behind, skipping to next keyframe.",
+                                        self.device.serial,
+                                        lag,
+                                    )
+                            if skipping:
+                                continue
+
+                        if min_frame_interval is not None:
+                            now = monotonic()
+                            # Nothing references disposable frames, so skipping them
+                            # doesn't break the following frames
+                            if (
+                                now - last_decoded < min_frame_interval
+                                and _is_disposable(bytes(packet))
+                            ):
+                                continue
+                            last_decoded = now
+
+                        # A bad packet only costs itself, the rest of the batch is still decoded
+                        try:
+                            frames = decode(packet)
+                        except av.InvalidDataError as e:
+                            self.__logger.warning(
+                                "[%s] AV decoding error (skipping packet): %s",
+                                self.device.serial,
+                                e,
+                            )
+                            continue
 
-                    for packet in packets:
-                        frames = codec.decode(packet)
                         for frame in frames:
-                            self.last_frame = frame.to_ndarray(format="bgr24")
-                            self._send_to_listeners(ListenEvent.FRAME, self.last_frame)
+                            if not self.is_running:
+                                break
+
+                            if self._yuv_planes_listeners:
+                                send_yuv_planes(frame)
+
+                            if queue_frame is not None:
+                                queue_frame(frame)
+                                continue
+
+                            if use_buffers:
+                                last_frame = frame_buffers[buffer_index] = (
+                                    _frame_to_ndarray(
+                                        frame,
+                                        frame_format,
+                                        frame_buffers[buffer_index],
+                                        use_numba,
+                                    )
+                                )
+                                buffer_index ^= 1
+                            else:
+                                last_frame = frame.to_ndarray(format=frame_format)
+                            self.last_frame = last_frame
+                            send_frame(last_frame)
+
+                    relax_buffer()
+
+                # Wait for new data, or for `stop` to write to the wakeup socket
+                if not select(timeout=0.5):
+                    relax_buffer(idle=True)
+                    continue
+
+                # Drain everything that is available right now, straight into the buffer
+                while True:
+                    try:
+                        received = recv_into(video_socket, recv_chunk)
+                    except BlockingIOError:
+                        break
+                    if not received:
+                        self.__logger.debug(
+                            "[%s] Video stream ended (socket closed).",
+                            self.device.serial,
+                        )
+                        stream_ended = True
+                        break
 
             except (socket.error, BrokenPipeError, ConnectionResetError) as e:
                 if self.is_running:
                     self.__logger.warning(
-                        f"[{self.device.serial}] Socket error, stopping loop: {e}"
+                        "[%s] Socket error, stopping loop: %s", self.device.serial, e
                     )
                 break
             except av.InvalidDataError as e:
                 self.__logger.warning(
-                    f"[{self.device.serial}] AV decoding error (skipping packet): {e}"
+                    "[%s] AV decoding error (skipping packet): %s",
+                    self.device.serial,
+                    e,
                 )
                 continue
             except Exception as e:
                 if self.is_running:
                     self.__logger.error(
-                        f"[{self.device.serial}] Unexpected stream loop error: {e}",
+                        "[%s] Unexpected stream loop error: %s",
+                        self.device.serial,
+                        e,
                         exc_info=True,
                     )
                 break
 
+        # The loop owns the selector and the wakeup pair, so `stop` called from a
+        # listener doesn't close them while they are still registered
+        _ = selector.unregister(wakeup_r)
+        selector.close()
+        wakeup_r.close()
+        if wakeup_w:
+            wakeup_w.close()
+        self._wakeup_r = self._wakeup_w = None
+        self._loop_thread = None
         self.is_running = False
-        self.__logger.info(f"[{self.device.serial}] Stream loop stopped.")
+        if self._full_frames is not None:
+            self._full_frames.put(None)  # Stops the dispatch thread
+        self.__logger.info("[%s] Stream loop stopped.", self.device.serial)
+
+    def _start_dispatcher(self):
+        """Preallocates the frame pool and starts the thread which delivers queued frames."""
+        assert self.resolution is not None, "Resolution is None"
+
+        shape = _frame_shape(self.frame_format, *self.resolution)
+        self._empty_frames = queue.Queue(maxsize=self.frame_queue_size)
+        self._full_frames = queue.Queue()
+        for _ in range(self.frame_queue_size):
+            self._empty_frames.put_nowait(np.empty(shape, dtype=np.uint8))
+        self._queue_paused = False
+
+        self._dispatch_thread = threading.Thread(target=self._dispatch_loop)
+        self._dispatch_thread.start()
+
+    def _queue_frame(self, frame: av.VideoFrame):
+        """Copies a decoded frame into a free pool buffer and queues it for the dispatch thread."""
+        assert self._empty_frames is not None and self._full_frames is not None
+
+        # The frame is still decoded (later frames reference it), but converting and
+        # queueing it is skipped while the consumer is lagging behind
+        free = self._empty_frames.qsize() / self.frame_queue_size
+        if self._queue_paused:
+            if free < self.unpause_empty_proportion:
+                return
+            self._queue_paused = False
+            self.__logger.debug("[%s] Frame queue resumed.", self.device.serial)
+        elif free < self.pause_empty_proportion:
+            self._queue_paused = True
+            self.__logger.debug(
+                "[%s] Frame queue paused, consumer is lagging.", self.device.serial
+            )
+            return
+
+        try:
+            buffer = self._empty_frames.get_nowait()
+        except queue.Empty:
+            return  # Every buffer is in use, drop frame
+
+        self._full_frames.put(
+            _frame_to_ndarray(frame, self.frame_format, buffer, self.use_numba)
+        )
+
+    def _dispatch_loop(self):
+        """Delivers queued frames to the listeners and returns their buffers to the pool."""
+        empty_frames, full_frames = self._empty_frames, self._full_frames
+        assert empty_frames is not None and full_frames is not None
+
+        while True:
+            frame = full_frames.get()
+            if frame is None:
+                break
+
+            self.last_frame = frame
+            self._send_frame(frame)
+            empty_frames.put_nowait(frame)
 
     def add_listener(self, event: ListenEvent, listener: Callable[..., Any]):  # pyright: ignore[reportExplicitAny]
         """
         Add a listener for a specific event.
 
         Args:
-            event: The event to listen for ("frame" or "init").
+            event: The event to listen for ("frame", "frame_yuv_planes" or "init").
             listener: The callback function.
                       - "frame" listeners receive one argument: the frame (np.ndarray).
+                        yuv420p, numba and frame queue buffers are reused for later
+                        frames, so call `.copy()` on them to keep them around.
+                      - "frame_yuv_planes" listeners receive the y, u and v planes (np.ndarray)
+                        and the (width, height) of the frame. The planes are zero-copy views
+                        of the decoder output, only valid during the call, so `.copy()` them
+                        to keep them around. Called from the stream loop, even with a frame queue.
                       - "init" listeners receive no arguments.
         """
         if event in self.listeners:
             self.listeners[event].append(listener)
+            self._update_listener_snapshots()
         else:
             raise ValueError(f"Unknown event: {event}")
 
@@ -364,6 +967,12 @@ class ScrcpyClient:
         """Remove a listener for a specific event."""
         if event in self.listeners and listener in self.listeners[event]:
             self.listeners[event].remove(listener)
+            self._update_listener_snapshots()
+
+    def _update_listener_snapshots(self):
+        """Rebuild the listener tuples used in the per-frame hot path."""
+        self._frame_listeners = tuple(self.listeners[ListenEvent.FRAME])
+        self._yuv_planes_listeners = tuple(self.listeners[ListenEvent.FRAME_YUV_PLANES])
 
     def _send_to_listeners(self, event: ListenEvent, *args, **kwargs):
         """Send an event to all registered listeners."""
@@ -371,7 +980,34 @@ class ScrcpyClient:
             try:
                 listener(*args, **kwargs)
             except Exception as e:
-                self.__logger.error(f"Error in listener for event '{event}': {repr(e)}")
+                self.__logger.error("Error in listener for event '%s': %r", event, e)
+
+    def _send_yuv_planes(self, frame: av.VideoFrame):
+        """Send views of the frame's yuv420p planes to all yuv plane listeners."""
+        if frame.format.name != "yuv420p":
+            frame = frame.reformat(format="yuv420p")  # e.g. nv12 from hwaccel
+
+        y, u, v = (_plane_to_ndarray(plane, plane.width) for plane in frame.planes)
+        size = (frame.width, frame.height)
+        for listener in self._yuv_planes_listeners:
+            try:
+                listener(y, u, v, size)
+            except Exception as e:
+                self.__logger.error(
+                    "Error in listener for event '%s': %r",
+                    ListenEvent.FRAME_YUV_PLANES,
+                    e,
+                )
+
+    def _send_frame(self, frame: np.ndarray):
+        """Send a frame to all frame listeners, without the generic event lookup."""
+        for listener in self._frame_listeners:
+            try:
+                listener(frame)
+            except Exception as e:
+                self.__logger.error(
+                    "Error in listener for event '%s': %r", ListenEvent.FRAME, e
+                )
 
     def start(self, threaded: bool = True):
         """
@@ -381,7 +1017,7 @@ class ScrcpyClient:
             threaded: If True, the video stream runs in a separate thread.
         """
         if self.is_running:
-            self.__logger.warning(f"[{self.device.serial}] Client is already running.")
+            self.__logger.warning("[%s] Client is already running.", self.device.serial)
             return
 
         self._push_server()
@@ -390,6 +1026,10 @@ class ScrcpyClient:
             return
 
         self.is_running = True
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        if self.frame_queue_size > 0:
+            self._start_dispatcher()
+
         if threaded:
             self._stream_thread = threading.Thread(target=self._stream_loop)
             self._stream_thread.start()
@@ -398,21 +1038,48 @@ class ScrcpyClient:
 
     def stop(self):
         """Stop the client and clean up resources."""
-        self.__logger.info(f"[{self.device.serial}] Stopping client...")
+        self.__logger.info("[%s] Stopping client...", self.device.serial)
         self.is_running = False
 
-        if self._stream_thread and self._stream_thread.is_alive():
+        wakeup_w = self._wakeup_w
+        if wakeup_w:
+            try:
+                # Wakes up the stream loop if it is waiting for data
+                _ = wakeup_w.send(b"\0")
+            except OSError:
+                pass  # Already closed
+
+        if (
+            self._stream_thread
+            and self._stream_thread.is_alive()
+            and self._stream_thread is not threading.current_thread()
+        ):
             self._stream_thread.join()
 
+        if (
+            self._dispatch_thread
+            and self._dispatch_thread.is_alive()
+            and self._dispatch_thread is not threading.current_thread()
+        ):
+            self._dispatch_thread.join()
+
         if self._control_socket:
             self._control_socket.close()
+        if self._video_stream:
+            self._video_stream.close()
         if self._video_socket:
             self._video_socket.close()
+        # A running stream loop (e.g. `stop` was called from a listener) closes the
+        # wakeup pair itself when it exits
+        if self._loop_thread is None and self._wakeup_r and self._wakeup_w:
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+            self._wakeup_r = self._wakeup_w = None
 
         if self._server_process:
             self._server_process.terminate()
             _ = self._server_process.wait()
-            self.__logger.debug(f"[{self.device.serial}] Server process terminated.")
+            self.__logger.debug("[%s] Server process terminated.", self.device.serial)
 
         if self._local_port:
             try:
@@ -421,12 +1088,12 @@ class ScrcpyClient:
                 _ = self.device.shell(
                     ["reverse", "--remove", f"localabstract:{self.socket_name}"]
                 )
-                self.__logger.debug(f"[{self.device.serial}] Reverse tunnel removed.")
+                self.__logger.debug("[%s] Reverse tunnel removed.", self.device.serial)
             except Exception as e:
                 self.__logger.warning(
-                    f"[{self.device.serial}] Failed to remove reverse tunnel: {e}"
+                    "[%s] Failed to remove reverse tunnel: %s", self.device.serial, e
                 )
 
         self.resolution = None
         self.last_frame = None
-        self.__logger.info(f"[{self.device.serial}] Client stopped.")
+        self.__logger.info("[%s] Client stopped.", self.device.serial)
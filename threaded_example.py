@@ -3,7 +3,7 @@ import cv2
 import numpy as np
 import scrcpy_client
 import adbutils
-import queue
+import collections
 import threading
 
 logging.basicConfig(
@@ -12,8 +12,8 @@ logging.basicConfig(
 )
 
 
-# Thread-safe queue to pass frames
-frame_queue = queue.Queue()
+# Holds only the newest frame, appending atomically drops the older one
+latest_frame: collections.deque[np.ndarray] = collections.deque(maxlen=1)
 # Thread-safe event to signal stopping
 stop_event = threading.Event()
 
@@ -22,11 +22,8 @@ def on_frame(frame: np.ndarray | None) -> None:
         # Main thread should stop
         stop_event.set()
         return
-    try:
-        frame_queue.put_nowait(frame)
-    except queue.Full:
-        # Main thread is lagging; drop frame
-        pass
+    # The client reuses the frame buffer, so copy it before handing it off
+    latest_frame.append(frame.copy())
 
 def main():
     try:
@@ -37,24 +34,19 @@ def main():
 
     client = None
     try:
-        client = scrcpy_client.ScrcpyClient(device, "./scrcpy-server.apk")
+        client = scrcpy_client.ScrcpyClient(
+            device, "./scrcpy-server.apk", frame_format="yuv420p"
+        )
         client.add_listener(scrcpy_client.ListenEvent.FRAME, on_frame)
 
         # Start the client in a background thread
         client.start(threaded=True) 
         logging.info("Streaming... Press q in the OpenCV window to stop")
 
-        latest_frame = None
         while not stop_event.is_set():
-            try:
-                while True:
-                    frame = frame_queue.get_nowait()
-                    latest_frame = frame
-            except queue.Empty:
-                pass
-
-            if latest_frame is not None:
-                cv2.imshow("frame", latest_frame)
+            if latest_frame:
+                # Only convert to bgr for displaying
+                cv2.imshow("frame", cv2.cvtColor(latest_frame[0], cv2.COLOR_YUV2BGR_I420))
 
             if cv2.waitKey(10) & 0xFF == ord("q"):
                 logging.info("q pressed, stopping...")
@@ -18,7 +18,8 @@ class StreamViewer:
             self.client.stop()
             return
 
-        cv2.imshow("frame", frame)
+        # Only convert to bgr for displaying
+        cv2.imshow("frame", cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420))
 
         if cv2.waitKey(10) & 0xFF == ord("q"):
             logging.info("q pressed, stopping...")
@@ -33,7 +34,9 @@ def main():
         logging.info(f"Error connecting to ADB device: {e}")
         return
 
-    client = scrcpy_client.ScrcpyClient(device, "./scrcpy-server.apk")
+    client = scrcpy_client.ScrcpyClient(
+        device, "./scrcpy-server.apk", frame_format="yuv420p"
+    )
     viewer = StreamViewer(client)
 
     client.add_listener(scrcpy_client.ListenEvent.FRAME, viewer.on_frame)